@@ -44,6 +44,8 @@ class AssistantService:
         """
         self.language = language
         self.agents = {}
+        # Tool definitions per agent ID, rebuilt only when agents change
+        self._tools_cache = {}
 
     # ---------------------------
     # AGENT TOOL RETRIEVAL
@@ -60,15 +62,17 @@ class AssistantService:
             list: A list of tool definitions (dictionaries) containing
                   'type', 'name', 'parameters', and 'description'.
         """
-        return [
-            {
-                "type": "function",
-                "name": tool["name"],
-                "parameters": tool["parameters"],
-                "description": tool["description"],
-            }
-            for tool in self.agents[id]["tools"]
-        ]
+        if id not in self._tools_cache:
+            self._tools_cache[id] = [
+                {
+                    "type": "function",
+                    "name": tool["name"],
+                    "parameters": tool["parameters"],
+                    "description": tool["description"],
+                }
+                for tool in self.agents[id]["tools"]
+            ]
+        return self._tools_cache[id]
 
     # ---------------------------
     # AGENT REGISTRATION
@@ -90,6 +94,7 @@ class AssistantService:
         self.agents[agent["id"]] = agent
         # Also register as root for compatibility
         self.agents["root"] = agent
+        self._tools_cache.clear()
 
     # ---------------------------
     # AGENT RETRIEVAL
@@ -20,6 +20,8 @@ class AssistantService:
     def __init__(self, language: str = "English"):
         self.language = language
         self.agents = {}
+        # Tool definitions per agent ID, rebuilt only when agents change
+        self._tools_cache = {}
 
     def get_tools_for_assistant(self, id):
         """Retrieve all available tools for a specific assistant.
@@ -33,6 +35,10 @@ class AssistantService:
         Returns:
             list: A list of tool definitions including both real tools and other assistants as tools
         """
+        # Reuse the definitions built on a previous connect or agent switch
+        if id in self._tools_cache:
+            return self._tools_cache[id]
+
         # Get the specified agent's tools
         agent_real_tools = self.agents[id]["tools"]
 
@@ -61,6 +67,7 @@ class AssistantService:
             for tool in combined_tools
         ]
 
+        self._tools_cache[id] = tools_definitions
         return tools_definitions
 
     def register_agent(self, agent):
@@ -78,6 +85,7 @@ class AssistantService:
         )
         # Store the agent in the agents dictionary
         self.agents[agent["id"]] = agent
+        self._tools_cache.clear()
 
     def get_agent(self, id):
         """Retrieve an agent by its ID.
@@ -123,6 +131,7 @@ class AssistantService:
 
         # Register the root agent under both its own ID and "root"
         self.agents["root"] = self.agents[root_agent["id"]] = root_agent
+        self._tools_cache.clear()
 
     async def get_tool_response(self, tool_name, parameters, call_id):
         """Execute a tool or switch to another agent based on the tool name.
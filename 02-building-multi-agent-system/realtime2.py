@@ -3,12 +3,14 @@
 import os
 import re
 import json
+import logging
 import base64
+import functools
 import asyncio
 import inspect
 import traceback
 from datetime import datetime, timezone
-from collections import defaultdict
+from collections import defaultdict, deque
 
 import numpy as np
 import websockets
@@ -18,6 +20,12 @@ from chainlit.config import config
 
 from assistant_service import AssistantService
 
+# Seconds of input audio kept locally for splicing user speech
+INPUT_AUDIO_BUFFER_SECONDS = 60
+# Input audio is sent in whole 20 ms frames, three frames (60 ms) per append event
+INPUT_AUDIO_FRAME_MS = 20
+INPUT_AUDIO_FRAMES_PER_APPEND = 3
+
 
 def float_to_16bit_pcm(float32_array):
     """
@@ -26,8 +34,11 @@ def float_to_16bit_pcm(float32_array):
     :param float32_array: Numpy array of dtype float32.
     :return: Numpy array of dtype int16.
     """
-    int16_array = np.clip(float32_array, -1, 1) * 32767
-    return int16_array.astype(np.int16)
+    clipped = np.clip(float32_array, -1, 1)
+    # Scale and narrow to int16 in one ufunc pass, straight into the result array
+    int16_array = np.empty(clipped.shape, dtype=np.int16)
+    np.multiply(clipped, 32767, out=int16_array, casting="unsafe")
+    return int16_array
 
 
 def base64_to_array_buffer(base64_string):
@@ -46,15 +57,19 @@ def array_buffer_to_base64(array_buffer):
     Converts a numpy array buffer to a base64-encoded string.
     If the array is float32, it is first converted to 16-bit PCM.
 
-    :param array_buffer: A numpy array (float32, int16, or any type).
+    :param array_buffer: Raw PCM bytes or a numpy array (float32, int16, or any type).
     :return: Base64-encoded string.
     """
+    if isinstance(array_buffer, (bytes, bytearray, memoryview)):
+        # Raw PCM bytes can be encoded as-is, without an intermediate copy
+        return base64.b64encode(array_buffer).decode("utf-8")
+
     if array_buffer.dtype == np.float32:
         # Convert float32 data to int16 PCM before encoding
         array_buffer = float_to_16bit_pcm(array_buffer)
     else:
-        # Otherwise just grab its bytes
-        array_buffer = array_buffer.tobytes()
+        # Otherwise encode its buffer directly, copying only if non-contiguous
+        array_buffer = np.ascontiguousarray(array_buffer)
 
     return base64.b64encode(array_buffer).decode("utf-8")
 
@@ -79,6 +94,122 @@ def merge_int16_arrays(left, right):
         raise ValueError("Both items must be numpy arrays of int16")
 
 
+class AudioRingBuffer:
+    """
+    Ring buffer holding the most recent PCM16 input audio.
+
+    Storage is allocated on the first write, so clients that never send audio
+    pay nothing, and incoming chunks are then copied into it in place, so
+    appending audio normally never reallocates the buffer. Slices
+    are addressed by absolute byte position since the buffer was last cleared,
+    which keeps them compatible with the offsets derived from the server's
+    audio_start_ms/audio_end_ms timestamps.
+    """
+
+    # extend() runs for every microphone chunk; slots keep attribute access cheap
+    __slots__ = ("capacity", "_base_capacity", "_buffer", "_start", "_written")
+
+    def __init__(self, capacity):
+        """
+        :param capacity: Number of bytes of audio to retain.
+        """
+        self.capacity = capacity
+        self._base_capacity = capacity
+        self._buffer = None
+        self._start = 0
+        self._written = 0
+
+    def __len__(self):
+        """
+        Total number of bytes written since the buffer was last cleared.
+        """
+        return self._written
+
+    @property
+    def overwrites(self):
+        """
+        Number of bytes of the oldest audio that have been overwritten.
+
+        Once the ring is full the newest audio wins unless extend() is asked
+        to grow, so overwrites + retained bytes == bytes written at all times.
+        """
+        return self._start
+
+    def clear(self):
+        """
+        Drop all audio and restart positions at 0, reusing the storage.
+        """
+        self._start = 0
+        self._written = 0
+        if self.capacity != self._base_capacity:
+            # Give back the memory of an unusually long manual turn
+            self.capacity = self._base_capacity
+            self._buffer = None
+
+    def extend(self, data, grow=False):
+        """
+        Copy a chunk of audio into the ring, wrapping around at the end.
+
+        :param data: A bytes-like object with raw PCM16 audio.
+        :param grow: Enlarge the ring instead of overwriting retained audio.
+        """
+        view = memoryview(data).cast("B")
+        size = len(view)
+        retained = self._written - self._start
+        if grow and retained + size > self.capacity:
+            self._grow(retained + size)
+        if self._buffer is None:
+            self._buffer = bytearray(self.capacity)
+
+        capacity = self.capacity
+        buffer = self._buffer
+        written = self._written
+        if size > capacity:
+            # Only the tail of an oversized chunk can be retained
+            written += size - capacity
+            view = view[-capacity:]
+            size = capacity
+
+        offset = written % capacity
+        first = min(size, capacity - offset)
+        buffer[offset : offset + first] = view[:first]
+        if first < size:
+            buffer[: size - first] = view[first:]
+        self._written = written + size
+        self._start = max(self._start, self._written - capacity)
+
+    def _grow(self, needed):
+        """
+        Reallocate the ring with room for at least `needed` bytes, keeping the
+        retained audio at the same absolute positions.
+        """
+        retained = self[:]
+        self.capacity = max(needed, 2 * self.capacity)
+        self._buffer = bytearray(self.capacity)
+        self._written = self._start
+        self.extend(retained)
+
+    def __getitem__(self, key):
+        """
+        Return the retained audio between two absolute byte positions.
+
+        :param key: A slice of absolute byte positions (step is not supported).
+        :return: The requested audio as bytes, clipped to what is still retained.
+        """
+        start, stop, _ = key.indices(self._written)
+        start = max(start, self._start)
+        if start >= stop:
+            return b""
+
+        offset = start % self.capacity
+        size = stop - start
+        view = memoryview(self._buffer)
+        if offset + size <= self.capacity:
+            return bytes(view[offset : offset + size])
+        # The range wraps around the end of the ring: join both parts in one copy
+        return b"".join((view[offset:], view[: offset + size - self.capacity]))
+
+
 class RealtimeEventHandler:
     """
     A generic event dispatcher/handler system.
@@ -87,6 +218,9 @@ class RealtimeEventHandler:
 
     def __init__(self):
         self.event_handlers = defaultdict(list)
+        # Coroutine handlers waiting to run, drained in order by a single task
+        self._pending_handlers = deque()
+        self._drain_task = None
 
     def on(self, event_name, handler):
         """
@@ -106,18 +240,31 @@ class RealtimeEventHandler:
     def dispatch(self, event_name, event):
         """
         Dispatch an event to all handlers that are registered under event_name.
-        If the handler is a coroutine, it is scheduled with create_task.
-        Otherwise, it is called directly.
+        If the handler is a coroutine, it is queued for the single drain task,
+        which awaits handlers in dispatch order. Otherwise, it is called directly.
 
         :param event_name: The event name.
         :param event: The event data (usually a dictionary).
         """
         for handler in self.event_handlers[event_name]:
             if inspect.iscoroutinefunction(handler):
-                asyncio.create_task(handler(event))
+                self._pending_handlers.append((handler, event))
+                if self._drain_task is None or self._drain_task.done():
+                    self._drain_task = asyncio.create_task(self._drain_handlers())
             else:
                 handler(event)
 
+    async def _drain_handlers(self):
+        """
+        Run queued coroutine handlers one after another until none are left.
+        """
+        while self._pending_handlers:
+            handler, event = self._pending_handlers.popleft()
+            try:
+                await handler(event)
+            except Exception:
+                logger.error(traceback.format_exc())
+
     async def wait_for_next(self, event_name):
         """
         Wait (async) for the next occurrence of a particular event name,
@@ -133,7 +280,31 @@ class RealtimeEventHandler:
                 future.set_result(event)
 
         self.on(event_name, handler)
-        return await future
+        try:
+            return await future
+        finally:
+            # One-shot waiter: drop the handler so repeated waits don't pile up,
+            # unless clear_event_handlers() already did
+            handlers = self.event_handlers[event_name]
+            if handler in handlers:
+                handlers.remove(handler)
+
+
+@functools.cache
+def get_azure_token_provider():
+    """
+    Create the Entra ID credential and bearer token provider once per process.
+
+    Every Chainlit session builds its own RealtimeClient; sharing the provider
+    lets them reuse its cached token instead of each session running the
+    DefaultAzureCredential chain again on connect.
+
+    :return: A (credential, token_provider) tuple.
+    """
+    credentials = DefaultAzureCredential()
+    return credentials, get_bearer_token_provider(
+        credentials, "https://cognitiveservices.azure.com/.default"
+    )
 
 
 class RealtimeAPI(RealtimeEventHandler):
@@ -155,10 +326,11 @@ class RealtimeAPI(RealtimeEventHandler):
             endpoint = endpoint.replace("https://", "wss://")
         self.url = endpoint
         self.api_key = os.getenv("AZURE_OPENAI_API_KEY", "")
-        self.credentials = DefaultAzureCredential()
-        self.acquire_token = get_bearer_token_provider(
-            self.credentials, "https://cognitiveservices.azure.com/.default"
+        # Key-based auth headers never change, so build them once
+        self._api_key_headers = (
+            {"api-key": self.api_key} if self.api_key != "" else None
         )
+        self.credentials, self.acquire_token = get_azure_token_provider()
 
         # API version and deployment for Azure
         self.api_version = "2024-10-01-preview"
@@ -175,6 +347,9 @@ class RealtimeAPI(RealtimeEventHandler):
         """
         Helper for logging with a consistent prefix.
         """
+        # Skip building the timestamp prefix when debug logging is off
+        if not logger.isEnabledFor(logging.DEBUG):
+            return
         logger.debug(f"[Websocket/{datetime.utcnow().isoformat()}]", *args)
 
     async def connect(
@@ -192,14 +367,19 @@ class RealtimeAPI(RealtimeEventHandler):
 
         if self.is_connected():
             raise Exception("Already connected")
-        headers = (
-            {"api-key": self.api_key}
-            if self.api_key != ""
-            else {"Authorization": f"Bearer {self.acquire_token()}"}
-        )
+        headers = self._api_key_headers
+        if headers is None:
+            # Bearer tokens expire, so only that header is built per connection.
+            # Fetching one is blocking I/O; run it in a worker thread so the
+            # event loop keeps serving other sessions meanwhile.
+            token = await asyncio.to_thread(self.acquire_token)
+            headers = {"Authorization": f"Bearer {token}"}
         self.ws = await websockets.connect(
             f"{self.url}/openai/realtime?api-version={self.api_version}&deployment={model}",
             additional_headers=headers,
+            # Payloads are mostly base64 audio; per-message deflate costs CPU on
+            # both ends for every frame for little gain on a latency-bound stream
+            compression=None,
         )
         self.log(f"Connected to {self.url}")
         asyncio.create_task(self._receive_messages())
@@ -344,6 +524,15 @@ class RealtimeConversation:
             raise Exception(f"Missing conversation event processor for {event['type']}")
         return event_processor(self, event, *args)
 
+    def _ms_to_byte_offset(self, ms):
+        """
+        Convert a timestamp in milliseconds to a byte offset into mono PCM16 audio.
+
+        Audio is kept as flat mono int16 bytes, so the sample index maps straight
+        to a byte offset (2 bytes per sample) without an int16 view or reshape.
+        """
+        return (ms * self.default_frequency) // 1000 * 2
+
     def get_item(self, id):
         """
         Retrieve an item by its ID from the item lookup.
@@ -431,7 +620,7 @@ class RealtimeConversation:
         if not item:
             raise Exception(f'item.truncated: Item "{item_id}" not found')
 
-        end_index = (audio_end_ms * self.default_frequency) // 1000
+        end_index = self._ms_to_byte_offset(audio_end_ms)
 
         # Truncate transcript and audio
         item["formatted"]["transcript"] = ""
@@ -490,8 +679,8 @@ class RealtimeConversation:
         speech["audio_end_ms"] = audio_end_ms
 
         if input_audio_buffer:
-            start_index = (speech["audio_start_ms"] * self.default_frequency) // 1000
-            end_index = (speech["audio_end_ms"] * self.default_frequency) // 1000
+            start_index = self._ms_to_byte_offset(speech["audio_start_ms"])
+            end_index = self._ms_to_byte_offset(speech["audio_end_ms"])
             speech["audio"] = input_audio_buffer[start_index:end_index]
 
         return None, None
@@ -568,9 +757,8 @@ class RealtimeConversation:
             logger.debug(f'response.audio.delta: Item "{item_id}" not found')
             return None, None
 
-        # Convert the base64 chunk to a bytes object
-        array_buffer = base64_to_array_buffer(delta)
-        append_values = array_buffer.tobytes()
+        # The payload is already PCM16, so pass the decoded bytes through untouched
+        append_values = base64.b64decode(delta)
 
         # Merge or append audio here if needed.
         # item['formatted']['audio'] = merge_int16_arrays(item['formatted']['audio'], some_int16_buffer)
@@ -658,11 +846,27 @@ class RealtimeClient(RealtimeEventHandler):
         Resets session flags and merges default session config.
         """
         self.session_created = False
+        self._session_created_event = asyncio.Event()
         self.tools = {}
         self.session_config = self.default_session_config.copy()
-        self.input_audio_buffer = bytearray()
+        self.input_audio_buffer = self._new_input_audio_buffer()
+        self._pending_input_audio = bytearray()
+        self._input_audio_frame_bytes = (
+            RealtimeConversation.default_frequency * 2 * INPUT_AUDIO_FRAME_MS // 1000
+        )
+        self._input_audio_append_bytes = (
+            self._input_audio_frame_bytes * INPUT_AUDIO_FRAMES_PER_APPEND
+        )
         return True
 
+    def _new_input_audio_buffer(self):
+        """
+        Allocate the ring buffer holding recent PCM16 input audio (2 bytes per sample).
+        """
+        return AudioRingBuffer(
+            RealtimeConversation.default_frequency * 2 * INPUT_AUDIO_BUFFER_SECONDS
+        )
+
     def _add_api_event_handlers(self):
         """
         Registers handlers on the RealtimeAPI for both client and server events.
@@ -716,6 +920,9 @@ class RealtimeClient(RealtimeEventHandler):
         Logs any realtime event as a structured dictionary, then dispatches
         a 'realtime.event' for higher-level consumption.
         """
+        # Nothing consumes realtime.event unless a listener was registered
+        if not self.event_handlers.get("realtime.event"):
+            return
         realtime_event = {
             "time": datetime.utcnow().isoformat(),
             "source": "client" if event["type"].startswith("client.") else "server",
@@ -725,6 +932,7 @@ class RealtimeClient(RealtimeEventHandler):
 
     def _on_session_created(self, event):
         self.session_created = True
+        self._session_created_event.set()
 
     def _process_event(self, event, *args):
         """
@@ -880,8 +1088,7 @@ class RealtimeClient(RealtimeEventHandler):
         if not self.is_connected():
             raise Exception("Not connected, use .connect() first")
 
-        while not self.session_created:
-            await asyncio.sleep(0.001)
+        await self._session_created_event.wait()
         return True
 
     async def disconnect(self):
@@ -889,6 +1096,10 @@ class RealtimeClient(RealtimeEventHandler):
         Disconnect from the RealtimeAPI and clear conversation state.
         """
         self.session_created = False
+        self._session_created_event.clear()
+        self._pending_input_audio.clear()
+        # A new session restarts audio_start_ms at 0, so restart byte positions too
+        self.input_audio_buffer.clear()
         self.conversation.clear()
         if self.realtime.is_connected():
             await self.realtime.disconnect()
@@ -897,7 +1108,7 @@ class RealtimeClient(RealtimeEventHandler):
         """
         Returns the 'type' from the current turn detection config.
         """
-        return self.session_config.get("turn_detection", {}).get("type")
+        return (self.session_config.get("turn_detection") or {}).get("type")
 
     # -----------------------------
     # Tool Management
@@ -1019,16 +1230,50 @@ class RealtimeClient(RealtimeEventHandler):
         :param array_buffer: The raw audio data as a bytearray or numpy array.
         """
         if len(array_buffer) > 0:
-            await self.realtime.send(
-                "input_audio_buffer.append",
-                {
-                    "audio": array_buffer_to_base64(np.array(array_buffer)),
-                },
+            overwrites = self.input_audio_buffer.overwrites
+            # Manual turns are committed whole, so never drop their start
+            self.input_audio_buffer.extend(
+                array_buffer, grow=self.get_turn_detection_type() is None
             )
-            self.input_audio_buffer.extend(array_buffer)
+            self._log_input_audio_overwrites(overwrites)
+
+            # Coalesce chunks so each append carries whole frames, at least
+            # INPUT_AUDIO_FRAMES_PER_APPEND of them
+            self._pending_input_audio.extend(memoryview(array_buffer).cast("B"))
+            if len(self._pending_input_audio) >= self._input_audio_append_bytes:
+                await self._flush_input_audio(self._input_audio_frame_bytes)
 
         return True
 
+    async def _flush_input_audio(self, frame_bytes=1):
+        """
+        Send coalesced input audio to the server in a single append event.
+
+        :param frame_bytes: Only send whole multiples of this many bytes; the
+            remainder stays pending for the next append.
+        """
+        pending = self._pending_input_audio
+        size = len(pending) - len(pending) % frame_bytes
+        if size:
+            # Encode straight out of the reused pending buffer instead of slicing
+            # a copy; the view must be released before the buffer is trimmed
+            with memoryview(pending) as view:
+                audio = array_buffer_to_base64(view[:size])
+            del pending[:size]
+            await self.realtime.send("input_audio_buffer.append", {"audio": audio})
+
+    def _log_input_audio_overwrites(self, previous):
+        """
+        Log each time another full buffer's worth of old input audio has been overwritten.
+
+        :param previous: The overwrite count before the latest append.
+        """
+        buffer = self.input_audio_buffer
+        if buffer.overwrites // buffer.capacity > previous // buffer.capacity:
+            logger.debug(
+                f"Input audio buffer full, {buffer.overwrites} bytes of oldest audio overwritten"
+            )
+
     async def create_response(self):
         """
         Sends a request to create a new response if turn detection is off
@@ -1037,9 +1282,10 @@ class RealtimeClient(RealtimeEventHandler):
         """
         # If turn detection is disabled and we have audio, commit the buffer first
         if self.get_turn_detection_type() is None and len(self.input_audio_buffer) > 0:
+            await self._flush_input_audio()
             await self.realtime.send("input_audio_buffer.commit")
-            self.conversation.queue_input_audio(self.input_audio_buffer)
-            self.input_audio_buffer = bytearray()
+            self.conversation.queue_input_audio(self.input_audio_buffer[:])
+            self.input_audio_buffer.clear()
 
         # Then create the response
         await self.realtime.send("response.create")